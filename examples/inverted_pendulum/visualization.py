@@ -65,7 +65,7 @@ def animate_pendulum(t, states, length, filename=None):
 
     """
     # the number of pendulum bobs
-    numpoints = states.shape[1] / 2
+    numpoints = states.shape[1] // 2
 
     # first set up the figure, the axis, and the plot elements we want to
     # animate
@@ -96,6 +96,14 @@ def animate_pendulum(t, states, length, filename=None):
     # blank line for the pendulum
     line, = ax.plot([], [], lw=2, marker='o', markersize=6)
 
+    # Precompute the bob coordinates for every frame once so the animation
+    # callback only has to slice into these contiguous arrays.
+    angles = states[:, 1:numpoints]
+    bob_x = np.hstack((states[:, 0:1], states[:, 0:1] -
+                       length * np.cumsum(np.sin(angles), axis=1)))
+    bob_y = np.hstack((np.zeros((states.shape[0], 1)),
+                       length * np.cumsum(np.cos(angles), axis=1)))
+
     # initialization function: plot the background of each frame
     def init():
         time_text.set_text('')
@@ -108,19 +116,17 @@ def animate_pendulum(t, states, length, filename=None):
     def animate(i):
         time_text.set_text('time = {:2.2f}'.format(t[i]))
         rect.set_xy((states[i, 0] - cart_width / 2.0, -cart_height / 2))
-        x = np.hstack((states[i, 0], np.zeros((numpoints - 1))))
-        y = np.zeros((numpoints))
-        for j in np.arange(1, numpoints):
-            x[j] = x[j - 1] - length * np.sin(states[i, j])
-            y[j] = y[j - 1] + length * np.cos(states[i, j])
-        line.set_data(x, y)
+        line.set_data(bob_x[i], bob_y[i])
         return time_text, rect, line,
 
     # call the animator function
+    # The limits and labels are configured once above and the callbacks
+    # return the artists they touch, so blitting can be enabled to redraw
+    # only the cart, line, and time text each frame.
     anim = animation.FuncAnimation(fig, animate, frames=len(t),
                                    init_func=init,
                                    interval=t[-1] / len(t) * 1000,
-                                   blit=False, repeat=False)
+                                   blit=True, repeat=False)
     plt.show()
 
     # save the animation if a filename is given
@@ -3,16 +3,57 @@
 from collections import OrderedDict
 
 import numpy as np
-from scipy.interpolate import interp1d
 import sympy as sy
 import sympy.physics.mechanics as me
 import yeadon
 from pydy.codegen.ode_function_generators import generate_ode_function
+try:
+    import numba
+except ImportError:
+    numba = None
 
 sym_kwargs = {'positive': True, 'real': True}
 me.dynamicsymbols._t = sy.symbols('t', **sym_kwargs)
 
 
+def _eval_controller(x, t, time, sigs, gains, result, diff, controls):
+    """Interpolates the reference signals at time t on the uniform time
+    grid and writes the platform acceleration and full state feedback
+    torques into controls. The interpolated signals and the state error
+    are written into the preallocated result and diff buffers so no
+    arrays are allocated per call. This lives at module level and takes
+    only arrays and scalars so that numba can compile it when
+    available."""
+
+    num_nodes = time.shape[0]
+    num_sigs = sigs.shape[1]
+
+    # Saturate the node index and the blend factor instead of branching
+    # into a separate out of range path, so every call runs the same
+    # interpolation loop and the boundary values are held whenever the
+    # integrator steps beyond the time grid.
+    inv_interval = (num_nodes - 1) / (time[num_nodes - 1] - time[0])
+    k = min(max(int((t - time[0]) * inv_interval), 0), num_nodes - 2)
+    alpha = min(max((t - time[k]) * inv_interval, 0.0), 1.0)
+    for i in range(num_sigs):
+        result[i] = sigs[k, i] + alpha * (sigs[k + 1, i] - sigs[k, i])
+
+    for i in range(num_sigs - 1):
+        diff[i] = result[i] - x[i]
+
+    controls[0] = result[num_sigs - 1]
+    # The gain matrix is only 2x4, so unrolling the matrix-vector product
+    # into scalar arithmetic is cheaper than dispatching to np.dot.
+    controls[1] = (gains[0, 0] * diff[0] + gains[0, 1] * diff[1] +
+                   gains[0, 2] * diff[2] + gains[0, 3] * diff[3])
+    controls[2] = (gains[1, 0] * diff[0] + gains[1, 1] * diff[1] +
+                   gains[1, 2] * diff[2] + gains[1, 3] * diff[3])
+
+
+if numba is not None:
+    _eval_controller = numba.njit(cache=True)(_eval_controller)
+
+
 class PlanarStandingHumanOnMovingPlatform(object):
     """Generates the symbolic equations of motion of a 2D planar two body model
     representing a human standing on a antero-posteriorly moving platform
@@ -195,15 +236,17 @@ class PlanarStandingHumanOnMovingPlatform(object):
 
     def _orient_reference_frames(self):
 
-        self.frames['leg'].orient(self.frames['inertial'],
-                                  'Axis',
-                                  (self.coordinates['ankle_angle'],
-                                   self.frames['inertial'].z))
+        # The ordered dictionaries stay as the public containers, but the
+        # repeated lookups in these derivation methods are hoisted into
+        # locals.
+        inertial = self.frames['inertial']
+        leg = self.frames['leg']
+
+        leg.orient(inertial, 'Axis',
+                   (self.coordinates['ankle_angle'], inertial.z))
 
-        self.frames['torso'].orient(self.frames['leg'],
-                                    'Axis',
-                                    (self.coordinates['hip_angle'],
-                                     self.frames['leg'].z))
+        self.frames['torso'].orient(leg, 'Axis',
+                                    (self.coordinates['hip_angle'], leg.z))
 
     def _create_points(self):
 
@@ -216,17 +259,20 @@ class PlanarStandingHumanOnMovingPlatform(object):
 
     def _set_positions(self):
 
+        ankle = self.points['ankle']
+        hip = self.points['hip']
+        leg_y = self.frames['leg'].y
+
         vec = self.specified['platform_position'] * self.frames['inertial'].x
-        self.points['ankle'].set_pos(self.points['origin'], vec)
+        ankle.set_pos(self.points['origin'], vec)
 
-        vec = self.parameters['leg_length'] * self.frames['leg'].y
-        self.points['hip'].set_pos(self.points['ankle'], vec)
+        hip.set_pos(ankle, self.parameters['leg_length'] * leg_y)
 
-        vec = self.parameters['leg_com_length'] * self.frames['leg'].y
-        self.points['leg_mass_center'].set_pos(self.points['ankle'], vec)
+        self.points['leg_mass_center'].set_pos(
+            ankle, self.parameters['leg_com_length'] * leg_y)
 
-        vec = self.parameters['torso_com_length'] * self.frames['torso'].y
-        self.points['torso_mass_center'].set_pos(self.points['hip'], vec)
+        self.points['torso_mass_center'].set_pos(
+            hip, self.parameters['torso_com_length'] * self.frames['torso'].y)
 
     def _define_kin_diff_eqs(self):
 
@@ -245,28 +291,25 @@ class PlanarStandingHumanOnMovingPlatform(object):
 
     def _set_linear_velocities(self):
 
-        self.points['origin'].set_vel(self.frames['inertial'], 0)
+        inertial = self.frames['inertial']
+        leg = self.frames['leg']
+        ankle = self.points['ankle']
+        hip = self.points['hip']
+
+        self.points['origin'].set_vel(inertial, 0)
 
-        self.points['ankle'].set_vel(self.frames['inertial'],
-                                     self.specified['platform_speed'] *
-                                     self.frames['inertial'].x)
+        ankle.set_vel(inertial,
+                      self.specified['platform_speed'] * inertial.x)
 
-        self.points['leg_mass_center'].v2pt_theory(self.points['ankle'],
-                                                   self.frames['inertial'],
-                                                   self.frames['leg'])
+        self.points['leg_mass_center'].v2pt_theory(ankle, inertial, leg)
 
-        self.points['hip'].v2pt_theory(self.points['ankle'],
-                                       self.frames['inertial'],
-                                       self.frames['leg'])
+        hip.v2pt_theory(ankle, inertial, leg)
 
-        self.points['torso_mass_center'].v2pt_theory(self.points['hip'],
-                                                     self.frames['inertial'],
+        self.points['torso_mass_center'].v2pt_theory(hip, inertial,
                                                      self.frames['torso'])
 
     def _set_linear_accelerations(self):
 
-        self.points['origin'].set_vel(self.frames['inertial'], 0)
-
         # Note : This doesn't actually populate through in the KanesMethod
         # class. See https://github.com/sympy/sympy/issues/8244.
         vec = (self.specified['platform_acceleration'] *
@@ -310,20 +353,21 @@ class PlanarStandingHumanOnMovingPlatform(object):
         self.loads = OrderedDict()
 
         g = self.parameters['g']
+        inertial = self.frames['inertial']
+        hip_torque = self.specified['hip_torque']
 
-        vec = -self.parameters['leg_mass'] * g * self.frames['inertial'].y
+        vec = -self.parameters['leg_mass'] * g * inertial.y
         self.loads['leg_force'] = (self.points['leg_mass_center'], vec)
 
-        vec = -self.parameters['torso_mass'] * g * self.frames['inertial'].y
+        vec = -self.parameters['torso_mass'] * g * inertial.y
         self.loads['torso_force'] = (self.points['torso_mass_center'], vec)
 
-        vec = (self.specified['ankle_torque'] * self.frames['inertial'].z -
-               self.specified['hip_torque'] * self.frames['inertial'].z)
+        vec = (self.specified['ankle_torque'] * inertial.z -
+               hip_torque * inertial.z)
         self.loads['leg_torque'] = (self.frames['leg'], vec)
 
         self.loads['torso_torque'] = (self.frames['torso'],
-                                      self.specified['hip_torque'] *
-                                      self.frames['inertial'].z)
+                                      hip_torque * inertial.z)
 
     def _setup_problem(self):
         self._create_states()
@@ -341,11 +385,20 @@ class PlanarStandingHumanOnMovingPlatform(object):
         self._create_rigid_bodies()
         self._create_loads()
 
+        # Cache the symbol sequences that are needed repeatedly during the
+        # derivation so each consumer does not rebuild them from the
+        # ordered dictionaries.
+        self._coordinates_list = list(self.coordinates.values())
+        self._speeds_list = list(self.speeds.values())
+        self._states_list = self._coordinates_list + self._speeds_list
+        self._specified_list = list(self.specified.values())
+        self._constants_list = list(self.parameters.values())
+
     def _generate_eoms(self, simplify=False):
 
         self.kane = me.KanesMethod(self.frames['inertial'],
-                                   list(self.coordinates.values()),
-                                   list(self.speeds.values()),
+                                   self._coordinates_list,
+                                   self._speeds_list,
                                    self.kin_diff_eqs)
 
         fr, frstar = self.kane.kanes_equations(list(self.loads.values()),
@@ -354,42 +407,60 @@ class PlanarStandingHumanOnMovingPlatform(object):
         sub = {self.specified['platform_speed'].diff(self.time):
                self.specified['platform_acceleration']}
 
-        if simplify:
-            fr_plus_frstar = sy.trigsimp(fr + frstar)
-        else:
-            fr_plus_frstar = fr + frstar
+        # Substitute the platform acceleration in first so that trigsimp,
+        # which scales badly with expression size, operates on the smaller
+        # expression.
+        fr_plus_frstar = (fr + frstar).xreplace(sub)
 
-        self.fr_plus_frstar = fr_plus_frstar.xreplace(sub)
+        if simplify:
+            fr_plus_frstar = sy.trigsimp(fr_plus_frstar)
 
-        udots = sy.Matrix([s.diff(self.time) for s in self.speeds.values()])
+        self.fr_plus_frstar = fr_plus_frstar
 
-        m1 = self.fr_plus_frstar.diff(udots[0])
-        m2 = self.fr_plus_frstar.diff(udots[1])
+        udots = sy.Matrix([s.diff(self.time) for s in self._speeds_list])
 
         # M x' = F
-        self.mass_matrix = -m1.row_join(m2)
-        self.forcing_vector = sy.simplify(self.fr_plus_frstar +
+        # A single jacobian call builds both mass matrix columns in one
+        # traversal of the expression tree instead of one diff per speed.
+        self.mass_matrix = -self.fr_plus_frstar.jacobian(udots)
+        # The general simplify heuristic is very slow on these mechanics
+        # expressions and trigsimp produces the same compact form here.
+        self.forcing_vector = sy.trigsimp(self.fr_plus_frstar +
                                           self.mass_matrix * udots)
 
         M_top_rows = sy.eye(2).row_join(sy.zeros(2))
-        F_top_rows = sy.Matrix(list(self.speeds.values()))
+        F_top_rows = sy.Matrix(self._speeds_list)
 
         tmp = sy.zeros(2).row_join(self.mass_matrix)
         self.mass_matrix_full = M_top_rows.col_join(tmp)
         self.forcing_vector_full = F_top_rows.col_join(self.forcing_vector)
 
+    @staticmethod
+    def _solve_2x2(M, F):
+        """Returns the symbolic solution of M * X = F for a 2x2 M using the
+        closed form inverse. LUsolve introduces pivoting branches and
+        leaves large unfactored determinants in the result that blow up
+        later simplification and code generation."""
+
+        det = M[0, 0] * M[1, 1] - M[0, 1] * M[1, 0]
+
+        top = (M[1, 1] * F.row(0) - M[0, 1] * F.row(1)) / det
+        bot = (M[0, 0] * F.row(1) - M[1, 0] * F.row(0)) / det
+
+        return top.col_join(bot).applyfunc(sy.cancel)
+
     def _generate_rhs(self):
 
-        udot = self.mass_matrix.LUsolve(self.forcing_vector)
+        udot = self._solve_2x2(self.mass_matrix, self.forcing_vector)
         qdot_map = self.kane.kindiffdict()
         qdot = sy.Matrix([qdot_map[q.diff(self.time)] for q in
-                          self.coordinates.values()])
+                          self._coordinates_list])
         self.rhs = qdot.col_join(udot)
 
     def _create_symbolic_controller(self):
 
         states = self.states()
-        inputs = list(self.specified.values())[-2:]
+        inputs = self._specified_list[-2:]
 
         num_states = len(states)
         num_inputs = len(inputs)
@@ -472,9 +543,9 @@ class PlanarStandingHumanOnMovingPlatform(object):
     def _linearize(self):
 
         # x = [theta_a, theta_h, omega_a, omega_h]
-        states = list(self.coordinates.values()) + list(self.speeds.values())
+        states = self._states_list
         # r = [T_a, T_h]
-        specified = list(self.specified.values())[-2:]
+        specified = self._specified_list[-2:]
 
         # We are only concerned about the upright standing equilibrium
         # point.
@@ -488,11 +559,14 @@ class PlanarStandingHumanOnMovingPlatform(object):
 
         M = self.mass_matrix.xreplace(equilibrium)
 
-        A = A_top_rows.col_join(M.LUsolve(F_A))
-        B = B_top_rows.col_join(M.LUsolve(F_B))
+        A = A_top_rows.col_join(self._solve_2x2(M, F_A))
+        B = B_top_rows.col_join(self._solve_2x2(M, F_B))
 
-        self.A = sy.simplify(A)
-        self.B = sy.simplify(B)
+        # The equilibrium substitution leaves rational expressions in the
+        # constants, so cancel is all that is needed to compact them and it
+        # is much cheaper than the general simplify heuristic.
+        self.A = A.applyfunc(sy.cancel)
+        self.B = B.applyfunc(sy.cancel)
 
     def derive(self):
         self._setup_problem()
@@ -505,24 +579,42 @@ class PlanarStandingHumanOnMovingPlatform(object):
 
     def numerical_linear(self):
 
-        return (sy.matrix2numpy(self.A.xreplace(self.open_loop_par_map),
-                                dtype=float),
-                sy.matrix2numpy(self.B.xreplace(self.open_loop_par_map),
-                                dtype=float))
+        # Lambdify the linear matrices on first use and evaluate them
+        # numerically, which avoids a symbolic substitution traversal and
+        # elementwise float conversion on every call.
+        if not hasattr(self, '_numerical_linear_funcs'):
+            constants = list(self.open_loop_par_map.keys())
+            mods = [{'ImmutableMatrix': np.array}, 'numpy']
+            self._numerical_linear_funcs = (
+                sy.lambdify(constants, self.A, modules=mods),
+                sy.lambdify(constants, self.B, modules=mods))
+
+        eval_A, eval_B = self._numerical_linear_funcs
+        constant_values = list(self.open_loop_par_map.values())
+
+        return eval_A(*constant_values), eval_B(*constant_values)
 
     def closed_loop_ode_func(self, time, reference_noise,
-                             platform_acceleration):
+                             platform_acceleration, generator='cython'):
         """Returns a function that evaluates the continous closed loop
         system first order ODEs.
 
         Parameters
         ----------
         time : ndarray, shape(N,)
-            The monotonically increasing time values.
+            The monotonically increasing, uniformly spaced time values.
+            The controller locates its interpolation interval from a
+            single grid spacing, so nonuniform grids are rejected.
         reference_noise : ndarray, shape(N, 4)
             The reference noise vector at each time.
         platform_acceleration : ndarray, shape(N,)
             The acceleration of the platform at each time.
+        generator : string, optional
+            The pydy code generation backend used for the right hand side,
+            e.g. 'cython' or 'lambdify'. The cython backend compiles C
+            code each time this method is called; lambdify skips the
+            compile, and the need for a C toolchain, at the cost of slower
+            evaluations.
 
         Returns
         -------
@@ -537,49 +629,109 @@ class PlanarStandingHumanOnMovingPlatform(object):
 
         controls = np.empty(3, dtype=float)
 
-        all_sigs = np.hstack((reference_noise,
-                              np.expand_dims(platform_acceleration, 1)))
-        # NOTE : copy and assume_sorted do not seem to speed up the actual
-        # interpolation call. assume_sorted was introduced in SciPy 0.14.
-        interp_func = interp1d(time, all_sigs, axis=0, copy=False,
-                               assume_sorted=True)
+        time = np.ascontiguousarray(time, dtype=float)
+
+        # The controller kernel assumes a uniform grid when it computes the
+        # interpolation interval index, so fail loudly here instead of
+        # silently interpolating at the wrong nodes.
+        spacings = np.diff(time)
+        if not np.allclose(spacings, spacings[0]):
+            raise ValueError('time must be uniformly spaced.')
+
+        all_sigs = np.ascontiguousarray(
+            np.hstack((reference_noise,
+                       np.expand_dims(platform_acceleration, 1))))
 
         if self.unscaled_gain is None:
             s = 1.0
         else:
             s = self.unscaled_gain
 
+        gains = s * self.gain_scale_factors
+
+        # Work buffers reused by every controller evaluation.
+        result_buf = np.empty(all_sigs.shape[1])
+        diff_buf = np.empty(all_sigs.shape[1] - 1)
+
         def controller(x, t):
             """
             x = [theta_a, theta_h, omega_a, omega_h]
             r = [a, T_a, T_h]
             """
-            # TODO : This interpolation call is the most expensive thing
-            # when running odeint. Seems like InterpolatedUnivariateSpline
-            # may be faster, but it doesn't supprt a multidimensional y.
-            if t > time[-1]:
-                result = interp_func(time[-1])
-            else:
-                result = interp_func(t)
-
-            controls[0] = result[-1]
-            controls[1:] = np.dot(s * self.gain_scale_factors,
-                                  result[:-1] - x)
+            # The hot path lives in the module level _eval_controller so
+            # the interpolation and feedback math run as compiled code
+            # when numba is installed. This interpolation is the most
+            # expensive thing when running odeint.
+            _eval_controller(x, t, time, all_sigs, gains, result_buf,
+                             diff_buf, controls)
 
             return controls
 
         rhs = generate_ode_function(self.forcing_vector_full,
-                                    list(self.coordinates.values()),
-                                    list(self.speeds.values()),
-                                    list(self.parameters.values()),
+                                    self._coordinates_list,
+                                    self._speeds_list,
+                                    self._constants_list,
                                     mass_matrix=self.mass_matrix_full,
-                                    specifieds=list(self.specified.values())[-3:],
-                                    generator='cython')
+                                    specifieds=self._specified_list[-3:],
+                                    generator=generator)
 
         return rhs, controller, np.array(list(self.open_loop_par_map.values()))
 
+    def closed_loop_ode_jac_func(self):
+        """Returns a function that evaluates the Jacobian of the continous
+        closed loop system first order ODEs with respect to the states.
+
+        Returns
+        -------
+        jac : function
+            A function that evaluates the Jacobian of the right hand side
+            of the first order ODEs in a form easily used with the Dfun
+            argument of scipy.integrate.odeint.
+
+        """
+
+        states = self.states()
+        torques = self._specified_list[-2:]
+
+        if self.unscaled_gain is None:
+            s = 1.0
+        else:
+            s = self.unscaled_gain
+
+        # The controller applies T = S .* K * (ref(t) - x), so by the
+        # chain rule the closed loop Jacobian is the open loop Jacobian
+        # plus the torque partials times dT/dx = -S .* K. The torques are
+        # kept symbolic here and the lambdified result is evaluated at the
+        # torques the controller actually outputs, so the reference offset
+        # in the configuration dependent coefficients is retained. A
+        # substitution with the zero reference controller would drop that
+        # offset and give an inexact Jacobian.
+        dT_dx = -self.scale_matrix.multiply_elementwise(self.gain_matrix)
+
+        jac_sym = (self.rhs.jacobian(states) +
+                   self.rhs.jacobian(torques) * dT_dx)
+
+        num_map = dict(self.closed_loop_par_map)
+        for k in self.gain_symbols:
+            num_map[k] = s
+
+        jac_sym = jac_sym.xreplace(num_map)
+
+        eval_jac = sy.lambdify(states + self._specified_list[-3:],
+                               jac_sym,
+                               modules=[{'ImmutableMatrix': np.array},
+                                        'numpy'])
+
+        def jac(x, t, r, p):
+            """Returns the Jacobian of the closed loop ODEs with respect to
+            the states, shape(4, 4)."""
+            a, T_a, T_h = r(x, t)
+            return eval_jac(x[0], x[1], x[2], x[3], a, T_a, T_h)
+
+        return jac
+
     def first_order_implicit(self):
         return sy.Matrix(self.kin_diff_eqs).col_join(self.fr_plus_frstar_closed)
 
     def states(self):
-        return list(self.coordinates.values()) + list(self.speeds.values())
+        return list(self._states_list)
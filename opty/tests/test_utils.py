@@ -127,6 +127,53 @@ def test_ufuncify_matrix():
                             eval_matrix_loop_numpy(a_vals, b_vals, c_val))
 
 
+def test_sum_of_sines():
+
+    sigma = 0.01
+    frequencies = 2.0 * np.pi * np.array([1.0, 3.0, 5.5, 8.0]) / 10.0
+    time = np.linspace(0.0, 10.0, num=1001)
+
+    np.random.seed(1234)
+    sines, sines_prime, sines_double_prime = utils.sum_of_sines(
+        sigma, frequencies, time)
+
+    # Rebuild the three series by direct accumulation over the frequencies
+    # using the same seeded phases.
+    np.random.seed(1234)
+    phases = 2.0 * np.pi * np.random.ranf(len(frequencies))
+
+    amplitude = sigma / 2.0
+    expected = np.zeros_like(time)
+    expected_prime = np.zeros_like(time)
+    expected_double_prime = np.zeros_like(time)
+
+    for w, p in zip(frequencies, phases):
+        expected += amplitude * np.sin(w * time + p)
+        expected_prime += amplitude * w * np.cos(w * time + p)
+        expected_double_prime -= amplitude * w**2 * np.sin(w * time + p)
+
+    testing.assert_allclose(sines, expected, atol=1e-13)
+    testing.assert_allclose(sines_prime, expected_prime, atol=1e-12)
+    testing.assert_allclose(sines_double_prime, expected_double_prime,
+                            atol=1e-12)
+
+    # A second call with the same inputs hits the cached sine and cosine
+    # basis and must reproduce the first result exactly.
+    np.random.seed(1234)
+    again = utils.sum_of_sines(sigma, frequencies, time)
+
+    testing.assert_array_equal(again[0], sines)
+    testing.assert_array_equal(again[1], sines_prime)
+    testing.assert_array_equal(again[2], sines_double_prime)
+
+    # The basis cache is emptied once it grows past eight entries, so a
+    # stream of distinct inputs must not grow it without bound.
+    for i in range(1, 13):
+        utils.sum_of_sines(sigma, i * frequencies, time)
+
+    assert len(utils._sum_of_sines_basis_cache) <= 9
+
+
 def test_substitute_matrix():
 
     A = np.arange(1, 13, dtype=float).reshape(3, 4)
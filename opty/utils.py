@@ -415,6 +415,29 @@ def substitute_matrix(matrix, row_idxs, col_idxs, sub_matrix):
     return matrix
 
 
+_sum_of_sines_basis_cache = {}
+
+
+def _sum_of_sines_basis(frequencies, time):
+    """Returns the sine and cosine of the outer product of the time vector
+    and the frequencies, caching the result for repeated calls with the
+    same basis. These matrices are independent of the random phases drawn
+    in sum_of_sines, so repeated runs with the same frequencies and time
+    vector skip all of the transcendental evaluations."""
+
+    key = (frequencies.tobytes(), time.tobytes())
+
+    try:
+        return _sum_of_sines_basis_cache[key]
+    except KeyError:
+        if len(_sum_of_sines_basis_cache) > 8:
+            _sum_of_sines_basis_cache.clear()
+        arg = np.outer(time, frequencies)
+        basis = (np.sin(arg), np.cos(arg))
+        _sum_of_sines_basis_cache[key] = basis
+        return basis
+
+
 def sum_of_sines(sigma, frequencies, time):
     """Returns a sum of sines centered at zero along with its first and
     second derivatives.
@@ -437,19 +460,42 @@ def sum_of_sines(sigma, frequencies, time):
     sines_double_prime : ndarray, shape(n,)
         The second derivative of the sum of sines.
 
+    Notes
+    -----
+    The three returned arrays are views into the rows of a single
+    contiguous shape(3, n) array, so the series and its derivatives can
+    be stored or copied side by side without further concatenation.
+
     """
 
     phases = 2.0 * np.pi * np.random.ranf(len(frequencies))
 
-    sines = np.zeros_like(time)
-    sines_prime = np.zeros_like(time)
-    sines_double_prime = np.zeros_like(time)
+    frequencies = np.asarray(frequencies, dtype=float)
+    time = np.asarray(time, dtype=float)
+
+    sin_basis, cos_basis = _sum_of_sines_basis(frequencies, time)
 
     amplitude = sigma / 2.0
 
-    for w, p in zip(frequencies, phases):
-        sines += amplitude * np.sin(w * time + p)
-        sines_prime += amplitude * w * np.cos(w * time + p)
-        sines_double_prime -= amplitude * w**2 * np.sin(w * time + p)
+    cos_phases = np.cos(phases)
+    sin_phases = np.sin(phases)
+
+    # The angle sum identities expand sin(w * t + p) and cos(w * t + p) in
+    # terms of the cached basis, so each output reduces across the
+    # frequencies with a pair of matrix-vector products instead of a
+    # Python loop that accumulates one frequency at a time.
+    w = frequencies
+
+    out = np.empty((3, time.shape[0]))
+
+    np.add(sin_basis.dot(cos_phases), cos_basis.dot(sin_phases),
+           out=out[0])
+    np.subtract(cos_basis.dot(w * cos_phases),
+                sin_basis.dot(w * sin_phases), out=out[1])
+    np.add(sin_basis.dot(w**2 * cos_phases),
+           cos_basis.dot(w**2 * sin_phases), out=out[2])
+
+    out *= amplitude
+    out[2] *= -1.0
 
-    return sines, sines_prime, sines_double_prime
+    return out[0], out[1], out[2]